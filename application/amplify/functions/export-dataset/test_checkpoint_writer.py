@@ -0,0 +1,88 @@
+"""
+Unit Tests for CheckpointWriter
+
+Covers the background writer that stores export progress checkpoints
+in the DatasetExportProgress table.
+
+Run with: pytest test_checkpoint_writer.py -v
+"""
+import os
+import threading
+
+# boto3 clients are created at import time and need a region
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from handler import CheckpointWriter  # noqa: E402
+
+
+class StubProgressTable:
+    """Records update_item calls; optionally blocks until released."""
+
+    def __init__(self, block: bool = False):
+        self.written = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def update_item(self, **kwargs):
+        self.started.set()
+        self.release.wait(timeout=5)
+        self.written.append(kwargs['ExpressionAttributeValues'][':count'])
+
+
+def checkpoint(count: int) -> dict:
+    return {':count': count, ':total': 1000, ':aid': f'a{count}'}
+
+
+class TestCheckpointWriter:
+    """Every checkpoint may be superseded, but the last one must be written."""
+
+    def test_single_checkpoint_written_on_exit(self):
+        table = StubProgressTable()
+        with CheckpointWriter(table, 'export-1') as writer:
+            writer.submit(checkpoint(100))
+        assert table.written == [100]
+
+    def test_last_pending_checkpoint_flushed_on_exit(self):
+        table = StubProgressTable(block=True)
+        with CheckpointWriter(table, 'export-1') as writer:
+            writer.submit(checkpoint(100))
+            # 100 is being written; 200 stays pending until exit
+            assert table.started.wait(timeout=5)
+            writer.submit(checkpoint(200))
+            table.release.set()
+        assert table.written == [100, 200]
+
+    def test_newer_checkpoint_supersedes_pending(self):
+        table = StubProgressTable(block=True)
+        with CheckpointWriter(table, 'export-1') as writer:
+            writer.submit(checkpoint(100))
+            assert table.started.wait(timeout=5)
+            writer.submit(checkpoint(200))
+            writer.submit(checkpoint(300))
+            table.release.set()
+        assert table.written == [100, 300]
+
+    def test_no_checkpoint_writes_nothing(self):
+        table = StubProgressTable()
+        with CheckpointWriter(table, 'export-1'):
+            pass
+        assert table.written == []
+
+    def test_write_error_does_not_stop_writer(self):
+        table = StubProgressTable()
+        failed = threading.Event()
+
+        def failing_update_item(**kwargs):
+            if not failed.is_set():
+                failed.set()
+                raise RuntimeError('throttled')
+            table.written.append(kwargs['ExpressionAttributeValues'][':count'])
+
+        table.update_item = failing_update_item
+        with CheckpointWriter(table, 'export-1') as writer:
+            writer.submit(checkpoint(100))
+            assert failed.wait(timeout=5)
+            writer.submit(checkpoint(200))
+        assert table.written == [200]
@@ -6,31 +6,58 @@ Triggered by SQS messages for parallel per-model evaluation.
 
 Supports checkpoint/resume: when the Lambda approaches its timeout,
 it saves progress to DynamoDB and re-enqueues the job to SQS so the
-next invocation continues from where the previous one stopped.
+next invocation continues from where the previous one stopped.  A
+checkpoint is also saved every CHECKPOINT_INTERVAL samples so that an SQS
+redelivery after a crash resumes close to where it stopped.
 
 Metrics:
   - ANLS (Average Normalized Levenshtein Similarity): text accuracy (DocVQA standard)
   - IoU (Intersection over Union): bounding box spatial accuracy
 """
 import glob
-import json
 import os
 import shutil
 import boto3
+import orjson
 import wandb
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 from decimal import Decimal
-from typing import Dict, List
-from huggingface_hub import hf_hub_download
+from fnmatch import fnmatch
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
+from huggingface_hub import get_hf_file_metadata, hf_hub_download, hf_hub_url
+from huggingface_hub.utils import HfHubHTTPError
 from PIL import Image
 from io import BytesIO
 from metrics import calculate_anls, calculate_iou
 from prompts import get_evaluation_prompt
 from visualization import draw_bbox, format_bbox_str, normalize_bbox
 
+# Number of samples evaluated concurrently.  Bedrock calls are network-bound,
+# so threads overlap their latency; keep this within the model's TPS quota.
+EVAL_CONCURRENCY = int(os.environ.get('EVAL_CONCURRENCY', '8'))
+
 # AWS clients
-dynamodb = boto3.resource('dynamodb')
-bedrock_client = boto3.client('bedrock-runtime')
+# The Bedrock connection pool must cover every evaluation thread, otherwise
+# urllib3 serializes them on the default pool of 10.  Adaptive retries back
+# off client-side when concurrent threads hit ThrottlingException, and TCP
+# keep-alive keeps idle pooled connections from being dropped between calls.
+# Converse responses can take longer than botocore's default 60 s read
+# timeout under load; a timed-out call would be retried and billed again.
+dynamodb = boto3.resource('dynamodb', config=Config(retries={'mode': 'adaptive'}))
+bedrock_client = boto3.client(
+    'bedrock-runtime',
+    config=Config(
+        max_pool_connections=EVAL_CONCURRENCY * 2,
+        retries={'max_attempts': 6, 'mode': 'adaptive'},
+        tcp_keepalive=True,
+        connect_timeout=5,
+        read_timeout=120,
+    ),
+)
 sqs_client = boto3.client('sqs')
 ssm_client = boto3.client('ssm')
 
@@ -41,18 +68,73 @@ WANDB_PROJECT = os.environ.get('WANDB_PROJECT', 'biz-doc-vqa')
 # 120 seconds gives enough headroom for DynamoDB write + SQS send + W&B finish.
 CHECKPOINT_BUFFER_MS = 120_000
 
+# Longest image edge (px) sent to the model.  Matches the upload pipeline's
+# compressed size, so exported images normally pass through untouched.
+MODEL_IMAGE_MAX_EDGE = int(os.environ.get('MODEL_IMAGE_MAX_EDGE', '2048'))
+
+# Inference parameters shared by every Converse request (low temperature
+# for reproducible answers; answers are short JSON objects)
+MODEL_INFERENCE_CONFIG = {
+    'temperature': 0.1,
+    'maxTokens': 500,
+}
+
+# Bedrock model ids (comma-separated fnmatch patterns) invoked with
+# latency-optimized inference.  Opt-in: only some models and regions support
+# it, and it is billed differently from standard inference.
+LATENCY_OPTIMIZED_MODELS = [
+    pattern.strip()
+    for pattern in os.environ.get('BEDROCK_LATENCY_OPTIMIZED_MODELS', '').split(',')
+    if pattern.strip()
+]
+
+# Bedrock Converse rejects images larger than 3.75 MB
+MODEL_IMAGE_MAX_BYTES = int(3.75 * 1024 * 1024)
+
+# Local directory for files downloaded from HF dataset repos (one
+# subdirectory per repo, see dataset_dir)
+HF_DATASET_DIR = '/tmp/hf_dataset'
+
 # Number of images to download at a time from HuggingFace Hub.
 # Balances disk usage vs download overhead. With avg 535KB/image,
 # 100 images ≈ 52 MB which fits comfortably in Lambda /tmp.
 IMAGE_BATCH_SIZE = 100
 
+# Number of consumed samples between periodic checkpoint saves.  Lets an SQS
+# redelivery after a crash or transient failure resume near where it stopped
+# instead of re-evaluating the whole invocation's samples.
+CHECKPOINT_INTERVAL = int(os.environ.get('CHECKPOINT_INTERVAL', '50'))
+
+# Number of evaluated samples whose scores are logged to W&B in one call
+WANDB_LOG_INTERVAL = 50
+
 # Number of evaluated samples to accumulate before logging a W&B results table
 # batch and releasing wandb.Image references.  Keeps /tmp media files bounded.
 WANDB_TABLE_BATCH_SIZE = 50
 
+# AWS error codes that would fail the same way on every SQS redelivery
+# (invalid model id or request, missing permissions or resources).  Jobs
+# failing with these are marked FAILED without a retry; any other job-level
+# error is redriven through SQS, as it may be a transient outage (Bedrock
+# throttling, W&B or Hub unavailability).
+PERMANENT_ERROR_CODES = {
+    'ValidationException',
+    'AccessDeniedException',
+    'ResourceNotFoundException',
+    'ParameterNotFound',
+}
+
 # Module-level caches
 _table_cache: Dict[str, object] = {}
 _secrets_cache: Dict[str, str] = {}
+# Models that rejected latency-optimized inference in this container
+_latency_optimized_rejected: Set[str] = set()
+# metadata.jsonl path -> ((mtime_ns, size), parsed samples)
+_metadata_cache: Dict[str, Tuple[Tuple[int, int], List[Dict]]] = {}
+
+
+class HubDownloadError(Exception):
+    """A dataset file could not be fetched because the Hub was unavailable."""
 
 
 # Table name overrides passed via SQS message from the data-stack trigger.
@@ -113,7 +195,7 @@ def handler(event, context):
 
     for record in event.get('Records', []):
         try:
-            message = json.loads(record['body'])
+            message = orjson.loads(record['body'])
             process_evaluation_job(message)
         except Exception as e:
             print(f"Error processing message {record.get('messageId')}: {str(e)}")
@@ -122,6 +204,30 @@ def handler(event, context):
     return {'batchItemFailures': batch_item_failures}
 
 
+def is_transient_error(error: Exception) -> bool:
+    """Whether a job-level error is worth retrying through SQS redelivery.
+
+    Only errors known to fail the same way again are permanent; anything
+    unrecognized is retried.
+    """
+    if isinstance(error, HubDownloadError):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') not in PERMANENT_ERROR_CODES
+    if isinstance(error, HfHubHTTPError):
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        return status is None or status == 429 or status >= 500
+    # Malformed messages or metadata
+    if isinstance(error, (KeyError, ValueError)):
+        return False
+    # Errors raised from a sample error, e.g. when every sample failed
+    cause = error.__cause__
+    if isinstance(cause, Exception):
+        return is_transient_error(cause)
+    return True
+
+
 def is_approaching_timeout() -> bool:
     """Check if the Lambda is approaching its timeout.
 
@@ -137,9 +243,10 @@ def _cleanup_tmp():
     """Remove leftover files from previous warm-container invocations.
 
     On checkpoint-resume, Lambda may reuse the same container.  Prior W&B run
-    directories and HF downloads can consume hundreds of MB and cause
+    directories and HF image downloads can consume hundreds of MB and cause
     "No space left on device" errors.  This is safe because wandb.finish()
-    syncs all data before the previous invocation returns.
+    syncs all data before the previous invocation returns.  The small
+    metadata.jsonl is kept so warm invocations can reuse it.
     """
     # Clean up previous W&B run directories
     old_runs = glob.glob('/tmp/wandb/wandb/run-*')
@@ -148,11 +255,16 @@ def _cleanup_tmp():
             shutil.rmtree(run_dir, ignore_errors=True)
         print(f'Cleaned up {len(old_runs)} previous W&B run dir(s)')
 
-    # Clean up leftover HF dataset downloads
-    hf_dir = '/tmp/hf_dataset'
-    if os.path.exists(hf_dir):
-        shutil.rmtree(hf_dir, ignore_errors=True)
-        print('Cleaned up previous HF dataset downloads')
+    # Clean up leftover HF dataset images.  metadata.jsonl and the download
+    # metadata under .cache/ are kept: download_dataset_file reuses them only
+    # after the Hub confirms the file is current.
+    old_images = [
+        path for path in glob.glob(os.path.join(HF_DATASET_DIR, '*', 'data', '*'))
+        if os.path.basename(path) != 'metadata.jsonl'
+    ]
+    if old_images:
+        _cleanup_image_files(old_images)
+        print(f'Cleaned up {len(old_images)} previous HF dataset image(s)')
 
     # Clean up HF Hub cache to prevent cross-invocation residue on warm containers
     hf_home = '/tmp/hf_home'
@@ -215,6 +327,7 @@ def process_evaluation_job(message: Dict):
         )
 
     wandb_run = None
+    latency_optimized = use_latency_optimized(bedrock_model_id)
 
     try:
         # Initialize W&B
@@ -234,6 +347,7 @@ def process_evaluation_job(message: Dict):
                     'job_id': job_id,
                     'start_index': start_index,
                     'is_resume': is_resume,
+                    'latency_optimized': latency_optimized,
                 },
                 tags=['evaluation', model_id, dataset_version],
             )
@@ -242,146 +356,166 @@ def process_evaluation_job(message: Dict):
         print(f'Downloading metadata from {hf_repo_id}...')
         hf_token = get_secret('HF_TOKEN_SSM_PARAM')
         token_arg = hf_token if hf_token else None
-        metadata_path = hf_hub_download(
-            hf_repo_id,
-            filename='data/metadata.jsonl',
-            repo_type='dataset',
-            local_dir='/tmp/hf_dataset',
-            token=token_arg,
-        )
+        metadata_path = download_dataset_file(hf_repo_id, 'data/metadata.jsonl', token_arg)
         dataset = load_metadata(metadata_path)
         total_samples = len(dataset)
         print(f'Loaded {total_samples} samples (starting from index {start_index})')
 
-        # Restore accumulated metrics from checkpoint
-        running_anls = checkpoint.get('runningAnls', 0.0)
-        running_iou = checkpoint.get('runningIou', 0.0)
+        # Restore accumulated metrics from checkpoint.  Scores are kept as
+        # plain sums and divided only when a mean is reported.
         samples_evaluated = checkpoint.get('samplesEvaluated', 0)
+        sum_anls = checkpoint.get('runningAnls', 0.0) * samples_evaluated
+        sum_iou = checkpoint.get('runningIou', 0.0) * samples_evaluated
         samples_failed = checkpoint.get('samplesFailed', 0)
         failed_sample_errors: List[str] = []
+        # Most recent sample failure, and the most recent one a retry could
+        # succeed on (e.g. throttling that outlasted the client's own retries)
+        last_sample_error = None
+        last_transient_error = None
         results_data: List[Dict] = []
+        # Per-sample (anls, iou) scores not yet logged to W&B
+        pending_scores: List[Tuple[float, float]] = []
         checkpointed = False
 
         # Track downloaded image files for batch cleanup
         downloaded_files: List[str] = []
 
-        for i in range(start_index, total_samples):
-            # Check if we're approaching Lambda timeout
-            if is_approaching_timeout():
-                print(
-                    f'Approaching timeout at sample {i}/{total_samples}. '
-                    f'Saving checkpoint and re-enqueueing.'
-                )
-                save_checkpoint(
-                    job_table, evaluation_job_id,
-                    sample_index=i,
-                    samples_evaluated=samples_evaluated,
-                    samples_failed=samples_failed,
-                    running_anls=running_anls,
-                    running_iou=running_iou,
-                    part=checkpoint.get('part', 1) + 1,
-                )
-                reenqueue_job(message, queue_url)
-                checkpointed = True
-                break
-
-            sample = dataset[i]
-
-            # Download image on-demand if not yet present
-            image_path = os.path.join('/tmp/hf_dataset', 'data', sample['file_name'])
-            if not os.path.exists(image_path):
-                hf_hub_download(
-                    hf_repo_id,
-                    filename=f'data/{sample["file_name"]}',
-                    repo_type='dataset',
-                    local_dir='/tmp/hf_dataset',
-                    token=token_arg,
-                )
-            downloaded_files.append(image_path)
-
-            # Clean up previous batch of images to free disk space
-            if len(downloaded_files) > IMAGE_BATCH_SIZE:
-                _cleanup_image_files(downloaded_files[:-1])
-                downloaded_files = [downloaded_files[-1]]
-
-            try:
-                image = Image.open(image_path)
-                prediction = invoke_model(
-                    bedrock_model_id,
-                    image,
-                    sample['question'],
-                    sample.get('language', 'en'),
-                )
-
-                # Calculate ANLS (text accuracy)
-                anls = calculate_anls(prediction.get('answer', ''), sample['answers'])
-
-                # Extract bboxes for IoU and visualization
-                pred_bbox = prediction.get('bbox', [0.0, 0.0, 1.0, 1.0])
-                # Normalize pixel coords to 0-1 range if model ignored the prompt instruction
-                pred_bbox = normalize_bbox(pred_bbox, image.size)
-                gt_bbox = list(sample['answer_bbox'])
-
-                # Calculate IoU (bounding box accuracy)
-                iou = calculate_iou(pred_bbox, gt_bbox)
-
-                # Create annotated image with both bboxes drawn
-                annotated = image.copy().convert('RGB')
-                annotated = draw_bbox(annotated, gt_bbox, (0, 200, 0), 'GT')
-                annotated = draw_bbox(annotated, pred_bbox, (220, 0, 0), 'Pred')
-
-                samples_evaluated += 1
-                # Incremental running average
-                running_anls += (anls - running_anls) / samples_evaluated
-                running_iou += (iou - running_iou) / samples_evaluated
-
-                # Log incrementally to W&B
-                if wandb_run:
-                    wandb.log({
-                        'progress/samples_evaluated': samples_evaluated,
-                        'progress/samples_failed': samples_failed,
-                        'progress/running_anls': running_anls,
-                        'progress/running_iou': running_iou,
-                        'sample/anls': anls,
-                        'sample/iou': iou,
-                    })
+        def evaluate(i: int) -> Dict:
+            return evaluate_sample(
+                dataset[i], hf_repo_id, token_arg, bedrock_model_id,
+                annotate=wandb_run is not None,
+            )
 
-                results_data.append({
-                    'annotation_id': sample.get('annotation_id', f'a{i}'),
-                    'question': sample['question'],
-                    'ground_truth': '\n'.join(sample['answers']) if sample['answers'] else '',
-                    'prediction': prediction.get('answer', ''),
-                    'anls': round(anls, 4),
-                    'iou': round(iou, 4),
-                    'annotated_image': wandb.Image(annotated, file_type='jpg') if wandb_run else None,
-                    'predicted_bbox': format_bbox_str(pred_bbox),
-                    'ground_truth_bbox': format_bbox_str(gt_bbox),
-                })
-
-                if samples_evaluated % 10 == 0:
+        # Samples are evaluated concurrently (Bedrock calls are network-bound),
+        # but results are consumed in sample order so the checkpoint index
+        # always marks a point before which every sample has been accounted for.
+        executor = ThreadPoolExecutor(max_workers=EVAL_CONCURRENCY)
+        try:
+            for i, future in map_prefetched(
+                executor, evaluate, range(start_index, total_samples), EVAL_CONCURRENCY * 2,
+            ):
+                # Check if we're approaching Lambda timeout
+                if is_approaching_timeout():
                     print(
-                        f'Progress: {samples_evaluated}/{total_samples} '
-                        f'| ANLS: {running_anls:.4f} | IoU: {running_iou:.4f}'
+                        f'Approaching timeout at sample {i}/{total_samples}. '
+                        f'Saving checkpoint and re-enqueueing.'
+                    )
+                    save_checkpoint(
+                        job_table, evaluation_job_id,
+                        sample_index=i,
+                        samples_evaluated=samples_evaluated,
+                        samples_failed=samples_failed,
+                        running_anls=_mean(sum_anls, samples_evaluated),
+                        running_iou=_mean(sum_iou, samples_evaluated),
+                        part=checkpoint.get('part', 1) + 1,
+                    )
+                    reenqueue_job(message, queue_url)
+                    checkpointed = True
+                    break
+
+                # Periodic checkpoint for crash recovery.  The part number is
+                # unchanged because this invocation keeps running.
+                if i > start_index and (i - start_index) % CHECKPOINT_INTERVAL == 0:
+                    save_checkpoint(
+                        job_table, evaluation_job_id,
+                        sample_index=i,
+                        samples_evaluated=samples_evaluated,
+                        samples_failed=samples_failed,
+                        running_anls=_mean(sum_anls, samples_evaluated),
+                        running_iou=_mean(sum_iou, samples_evaluated),
+                        part=checkpoint.get('part', 1),
                     )
 
-                # Batch-log results table to bound /tmp disk usage from wandb media files
-                if wandb_run and len(results_data) >= WANDB_TABLE_BATCH_SIZE:
-                    _log_results_table(results_data)
-                    results_data = []
+                sample = dataset[i]
+                downloaded_files.append(sample_image_path(hf_repo_id, sample))
+
+                # Record the fallback if Bedrock rejected latency-optimized inference
+                if latency_optimized and not use_latency_optimized(bedrock_model_id):
+                    latency_optimized = False
+                    if wandb_run:
+                        wandb.config.update({'latency_optimized': False}, allow_val_change=True)
+
+                # Clean up previous batch of images to free disk space
+                if len(downloaded_files) > IMAGE_BATCH_SIZE:
+                    _cleanup_image_files(downloaded_files[:-1])
+                    downloaded_files = [downloaded_files[-1]]
+
+                try:
+                    result = future.result()
+                    anls = result['anls']
+                    iou = result['iou']
+                    pred_bbox = result['pred_bbox']
+                    gt_bbox = result['gt_bbox']
+
+                    samples_evaluated += 1
+                    sum_anls += anls
+                    sum_iou += iou
+
+                    # Log incrementally to W&B, one call per WANDB_LOG_INTERVAL samples
+                    if wandb_run:
+                        pending_scores.append((anls, iou))
+                        if len(pending_scores) >= WANDB_LOG_INTERVAL:
+                            _log_progress(
+                                pending_scores, samples_evaluated, samples_failed,
+                                sum_anls, sum_iou,
+                            )
+                            pending_scores = []
+
+                    results_data.append({
+                        'annotation_id': sample.get('annotation_id', f'a{i}'),
+                        'question': sample['question'],
+                        'ground_truth': '\n'.join(sample['answers']) if sample['answers'] else '',
+                        'prediction': result['prediction'],
+                        'anls': round(anls, 4),
+                        'iou': round(iou, 4),
+                        'annotated_image': wandb.Image(result['annotated_image'], file_type='jpg') if wandb_run else None,
+                        'predicted_bbox': format_bbox_str(pred_bbox),
+                        'ground_truth_bbox': format_bbox_str(gt_bbox),
+                    })
 
-            except Exception as e:
-                samples_failed += 1
-                error_msg = f'Sample {i}: {str(e)[:100]}'
-                print(f'Error evaluating sample {i}: {str(e)}')
-                # Keep first 10 error messages for diagnostics
-                if len(failed_sample_errors) < 10:
-                    failed_sample_errors.append(error_msg)
-                continue
+                    if samples_evaluated % 10 == 0:
+                        print(
+                            f'Progress: {samples_evaluated}/{total_samples} '
+                            f'| ANLS: {sum_anls / samples_evaluated:.4f} '
+                            f'| IoU: {sum_iou / samples_evaluated:.4f}'
+                        )
+
+                    # Batch-log results table to bound /tmp disk usage from wandb media files
+                    if wandb_run and len(results_data) >= WANDB_TABLE_BATCH_SIZE:
+                        _log_results_table(results_data)
+                        results_data = []
+
+                except HubDownloadError:
+                    # Hub outage: fail the job so SQS retries it from the
+                    # last checkpoint instead of dropping the remaining samples
+                    raise
+                except Exception as e:
+                    samples_failed += 1
+                    error_msg = f'Sample {i}: {str(e)[:100]}'
+                    print(f'Error evaluating sample {i}: {str(e)}')
+                    # Keep first 10 error messages for diagnostics
+                    if len(failed_sample_errors) < 10:
+                        failed_sample_errors.append(error_msg)
+                    last_sample_error = e
+                    if is_transient_error(e):
+                        last_transient_error = e
+                    continue
+        finally:
+            # Drop queued samples without joining in-flight Bedrock calls: a
+            # slow call (up to read_timeout per retry) must not hold the
+            # invocation past the Lambda timeout after a checkpoint, or SQS
+            # would redeliver the message and run the job twice.
+            executor.shutdown(wait=False, cancel_futures=True)
 
         # Clean up remaining downloaded images
         _cleanup_image_files(downloaded_files)
 
-        # Log results table for this run (including checkpointed partial runs)
+        # Log remaining progress and results table for this run
+        # (including checkpointed partial runs)
+        if wandb_run and pending_scores:
+            _log_progress(
+                pending_scores, samples_evaluated, samples_failed, sum_anls, sum_iou,
+            )
         if wandb_run and results_data:
             _log_results_table(results_data)
 
@@ -393,6 +527,9 @@ def process_evaluation_job(message: Dict):
             )
             return
 
+        running_anls = _mean(sum_anls, samples_evaluated)
+        running_iou = _mean(sum_iou, samples_evaluated)
+
         # Log failure summary
         if samples_failed > 0:
             print(
@@ -417,7 +554,7 @@ def process_evaluation_job(message: Dict):
             raise RuntimeError(
                 f'All {total_samples} samples failed to evaluate. '
                 f'Errors: {"; ".join(failed_sample_errors[:3])}'
-            )
+            ) from last_transient_error or last_sample_error
 
         # Update job status to COMPLETED and clear checkpoint
         now = datetime.now(timezone.utc).isoformat()
@@ -468,13 +605,35 @@ def process_evaluation_job(message: Dict):
                 ':now': now,
             },
         )
-        raise  # Re-raise for SQS retry / DLQ
+        if is_transient_error(e):
+            raise  # Re-raise for SQS retry / DLQ
+        # Permanent failure: the job is marked FAILED above; returning normally
+        # deletes the SQS message instead of redriving the whole evaluation.
+        print(f'Not retrying evaluation job for {model_id}: error is not transient')
 
     finally:
         if wandb_run:
             wandb.finish()
 
 
+def _log_progress(
+    scores: List[Tuple[float, float]],
+    samples_evaluated: int,
+    samples_failed: int,
+    sum_anls: float,
+    sum_iou: float,
+):
+    """Log running metrics and the distribution of recent sample scores to W&B."""
+    wandb.log({
+        'progress/samples_evaluated': samples_evaluated,
+        'progress/samples_failed': samples_failed,
+        'progress/running_anls': _mean(sum_anls, samples_evaluated),
+        'progress/running_iou': _mean(sum_iou, samples_evaluated),
+        'sample/anls_hist': wandb.Histogram([anls for anls, _ in scores]),
+        'sample/iou_hist': wandb.Histogram([iou for _, iou in scores]),
+    })
+
+
 def _log_results_table(results_data: List[Dict]):
     """Log evaluation results as a W&B Table."""
     columns = [
@@ -487,6 +646,11 @@ def _log_results_table(results_data: List[Dict]):
     wandb.log({'evaluation_results': table})
 
 
+def _mean(total: float, count: int) -> float:
+    """Mean of ``count`` accumulated scores, 0.0 before any sample is scored."""
+    return total / count if count else 0.0
+
+
 def load_checkpoint(job_table, evaluation_job_id: str) -> Dict:
     """Load checkpoint data from DynamoDB EvaluationJob record.
 
@@ -550,7 +714,7 @@ def reenqueue_job(message: Dict, queue_url: str):
 
     sqs_client.send_message(
         QueueUrl=queue_url,
-        MessageBody=json.dumps(message),
+        MessageBody=orjson.dumps(message).decode(),
     )
     print(f'Re-enqueued evaluation job {message["evaluationJobId"]} to continue')
 
@@ -559,21 +723,159 @@ def load_metadata(metadata_path: str) -> List[Dict]:
     """Load dataset metadata from metadata.jsonl.
 
     Returns list of sample dicts (without image data; images are downloaded on demand).
+    The parsed list is reused on warm invocations while the file is unchanged
+    (hf_hub_download leaves it untouched when the remote etag matches).
+    Callers must treat the samples as read-only.
     """
     if not os.path.exists(metadata_path):
         raise FileNotFoundError(f'metadata.jsonl not found at {metadata_path}')
 
-    samples: List[Dict] = []
-    with open(metadata_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            samples.append(json.loads(line))
+    stat = os.stat(metadata_path)
+    file_key = (stat.st_mtime_ns, stat.st_size)
+    cached = _metadata_cache.get(metadata_path)
+    if cached and cached[0] == file_key:
+        return cached[1]
+
+    with open(metadata_path, 'rb') as f:
+        data = f.read()
 
+    # orjson accepts surrounding whitespace, so lines are parsed unstripped
+    samples = [orjson.loads(line) for line in data.splitlines() if line and not line.isspace()]
+    _metadata_cache[metadata_path] = (file_key, samples)
     return samples
 
 
+def map_prefetched(
+    executor: ThreadPoolExecutor,
+    fn: Callable[[int], Dict],
+    items: Iterable[int],
+    window: int,
+) -> Iterator[Tuple[int, Future]]:
+    """Submit ``fn(item)`` to the executor, yielding ``(item, future)`` in input order.
+
+    At most ``window`` tasks are in flight, so work runs ahead of the
+    caller's serial loop by a bounded amount.  Exceptions surface when the
+    caller calls ``future.result()``.
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, item)))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def dataset_dir(hf_repo_id: str) -> str:
+    """Local directory for files downloaded from one HF dataset repo."""
+    return os.path.join(HF_DATASET_DIR, hf_repo_id.replace('/', '--'))
+
+
+def download_dataset_file(hf_repo_id: str, filename: str, token) -> str:
+    """Download a file from the HF dataset repo into its dataset_dir.
+
+    A copy left by an earlier invocation is reused only after the Hub
+    answers a metadata request: hf_hub_download silently falls back to an
+    existing local file when it cannot reach the Hub, which could evaluate
+    a re-exported dataset against stale metadata.
+
+    Network failures and retryable HTTP statuses are raised as
+    HubDownloadError; other HTTP errors (missing file, no access) propagate
+    unchanged.
+    """
+    local_dir = dataset_dir(hf_repo_id)
+    try:
+        if os.path.exists(os.path.join(local_dir, filename)):
+            get_hf_file_metadata(
+                hf_hub_url(hf_repo_id, filename, repo_type='dataset'), token=token,
+            )
+        return hf_hub_download(
+            hf_repo_id,
+            filename=filename,
+            repo_type='dataset',
+            local_dir=local_dir,
+            token=token,
+        )
+    except HfHubHTTPError as e:
+        if is_transient_error(e):
+            raise HubDownloadError(f'Failed to download {filename}: {e}') from e
+        raise
+    except OSError as e:
+        # Connection errors, or LocalEntryNotFoundError when the Hub is
+        # unreachable and the file is not cached locally
+        raise HubDownloadError(f'Failed to download {filename}: {e}') from e
+
+
+def sample_image_path(hf_repo_id: str, sample: Dict) -> str:
+    """Local path of a sample image downloaded from the HF dataset repo."""
+    return os.path.join(dataset_dir(hf_repo_id), 'data', sample['file_name'])
+
+
+def evaluate_sample(
+    sample: Dict,
+    hf_repo_id: str,
+    token,
+    bedrock_model_id: str,
+    annotate: bool = True,
+) -> Dict:
+    """Download one sample image, run the model on it and score the prediction.
+
+    The annotated image (both bboxes drawn) is only rendered when
+    ``annotate`` is set, since it is needed only for the W&B results table.
+
+    Runs on worker threads: boto3 clients are thread-safe and each call
+    only touches its own sample.
+    """
+    # Download image on-demand if not yet present
+    image_path = sample_image_path(hf_repo_id, sample)
+    if not os.path.exists(image_path):
+        download_dataset_file(hf_repo_id, f'data/{sample["file_name"]}', token)
+
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+
+    # Image.open only parses the header; pixels are decoded on demand
+    with Image.open(BytesIO(image_bytes)) as image:
+        # The model may answer in pixel coordinates of the image it was sent,
+        # so bbox normalization and drawing below use that (possibly
+        # downscaled) image
+        image, model_image_bytes = prepare_model_image(image_bytes, image)
+        prediction = invoke_model(
+            bedrock_model_id,
+            model_image_bytes,
+            sample['question'],
+            sample.get('language', 'en'),
+        )
+
+        # Calculate ANLS (text accuracy)
+        anls = calculate_anls(prediction.get('answer', ''), sample['answers'])
+
+        # Extract bboxes for IoU and visualization
+        pred_bbox = prediction.get('bbox', [0.0, 0.0, 1.0, 1.0])
+        # Normalize pixel coords to 0-1 range if model ignored the prompt instruction
+        pred_bbox = normalize_bbox(pred_bbox, image.size)
+        gt_bbox = list(sample['answer_bbox'])
+
+        # Calculate IoU (bounding box accuracy)
+        iou = calculate_iou(pred_bbox, gt_bbox)
+
+        # Create annotated image with both bboxes drawn
+        annotated = None
+        if annotate:
+            annotated = image.copy().convert('RGB')
+            annotated = draw_bbox(annotated, gt_bbox, (0, 200, 0), 'GT')
+            annotated = draw_bbox(annotated, pred_bbox, (220, 0, 0), 'Pred')
+
+    return {
+        'prediction': prediction.get('answer', ''),
+        'anls': anls,
+        'iou': iou,
+        'pred_bbox': pred_bbox,
+        'gt_bbox': gt_bbox,
+        'annotated_image': annotated,
+    }
+
+
 def _cleanup_image_files(file_paths: List[str]):
     """Delete downloaded image files to free disk space."""
     for path in file_paths:
@@ -584,23 +886,47 @@ def _cleanup_image_files(file_paths: List[str]):
             pass
 
 
-def invoke_model(bedrock_model_id: str, image, question: str, language: str) -> Dict:
-    """Invoke Bedrock model with image and question, return parsed answer + bbox.
+def prepare_model_image(image_bytes: bytes, image) -> Tuple[Image.Image, bytes]:
+    """Return the image to send to the model together with its JPEG bytes.
 
-    Uses language-specific prompts synchronized with annotation prompts
-    for consistent answer formatting (see prompts.py).
+    The exported dataset stores JPEG files within MODEL_IMAGE_MAX_EDGE,
+    which are sent as-is; decoding and re-encoding them would only cost CPU
+    and another generation of loss.  Larger images are downscaled (the
+    JPEG decoder's draft mode makes this cheap), and other formats or
+    JPEGs over Bedrock's size limit are re-encoded with PIL.
     """
-    # Convert PIL Image to JPEG bytes
-    img_buffer = BytesIO()
-    if image.mode == 'RGBA':
+    if (
+        image.format == 'JPEG'
+        and max(image.size) <= MODEL_IMAGE_MAX_EDGE
+        and len(image_bytes) <= MODEL_IMAGE_MAX_BYTES
+    ):
+        return image, image_bytes
+
+    image.thumbnail((MODEL_IMAGE_MAX_EDGE, MODEL_IMAGE_MAX_EDGE))
+    if image.mode not in ('RGB', 'L'):
         image = image.convert('RGB')
+    img_buffer = BytesIO()
     image.save(img_buffer, format='JPEG', quality=85)
-    img_bytes = img_buffer.getvalue()
+    return image, img_buffer.getvalue()
+
+
+def use_latency_optimized(bedrock_model_id: str) -> bool:
+    """Whether to request latency-optimized inference for a model."""
+    return bedrock_model_id not in _latency_optimized_rejected and any(
+        fnmatch(bedrock_model_id, pattern) for pattern in LATENCY_OPTIMIZED_MODELS
+    )
+
+
+def invoke_model(bedrock_model_id: str, img_bytes: bytes, question: str, language: str) -> Dict:
+    """Invoke Bedrock model with JPEG image bytes and question, return parsed answer + bbox.
 
+    Uses language-specific prompts synchronized with annotation prompts
+    for consistent answer formatting (see prompts.py).
+    """
     # Use language-specific prompt for consistent formatting with annotation
     prompt = get_evaluation_prompt(question, language)
 
-    response = bedrock_client.converse(
+    request = dict(
         modelId=bedrock_model_id,
         messages=[
             {
@@ -616,12 +942,31 @@ def invoke_model(bedrock_model_id: str, image, question: str, language: str) ->
                 ],
             },
         ],
-        inferenceConfig={
-            'temperature': 0.1,
-            'maxTokens': 500,
-        },
+        inferenceConfig=MODEL_INFERENCE_CONFIG,
     )
 
+    if use_latency_optimized(bedrock_model_id):
+        try:
+            response = bedrock_client.converse(
+                **request, performanceConfig={'latency': 'optimized'},
+            )
+        except ClientError as e:
+            error = e.response.get('Error', {})
+            # Per-request problems (image content, token limits) are also
+            # ValidationException; only an error about the performance
+            # configuration means the option is unsupported
+            message = error.get('Message', '').lower()
+            if error.get('Code') != 'ValidationException' or not (
+                'latency' in message or 'performance' in message
+            ):
+                raise
+            # Not available for this model/region: use standard inference from now on
+            print(f'Latency-optimized inference rejected for {bedrock_model_id}: {e}')
+            _latency_optimized_rejected.add(bedrock_model_id)
+            response = bedrock_client.converse(**request)
+    else:
+        response = bedrock_client.converse(**request)
+
     content = response.get('output', {}).get('message', {}).get('content', [])
     response_text = content[0].get('text', '') if content else ''
 
@@ -633,24 +978,22 @@ def parse_model_response(response_text: str) -> Dict:
     result: Dict = {'answer': '', 'bbox': [0.0, 0.0, 1.0, 1.0]}
 
     try:
-        # Remove markdown code fences if present
+        # Remove markdown code fences if present: drop the opening fence
+        # line (``` or ```json) and the closing fence
         text = response_text.strip()
         if text.startswith('```'):
-            lines = text.split('\n')
-            text = '\n'.join(lines[1:])
-            if text.endswith('```'):
-                text = text[:-3]
-            text = text.strip()
+            text = text.partition('\n')[2].removesuffix('```').strip()
 
-        parsed = json.loads(text)
+        parsed = orjson.loads(text)
         result['answer'] = str(parsed.get('answer', ''))
 
         bbox = parsed.get('bbox', [0, 0, 1, 1])
         if isinstance(bbox, list) and len(bbox) == 4:
             result['bbox'] = [float(v) for v in bbox]
 
-    except (json.JSONDecodeError, ValueError):
-        # Fallback: use raw text as answer
+    except ValueError:
+        # Not valid JSON (orjson.JSONDecodeError is a ValueError):
+        # fallback to the raw text as answer
         result['answer'] = response_text.strip()
 
     return result
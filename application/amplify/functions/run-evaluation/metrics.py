@@ -9,6 +9,8 @@ These functions are extracted from handler.py for testability.
 """
 from typing import List
 
+from rapidfuzz.distance import Levenshtein
+
 
 def calculate_anls(prediction: str, ground_truths: List[str], threshold: float = 0.5) -> float:
     """
@@ -39,59 +41,59 @@ def calculate_anls(prediction: str, ground_truths: List[str], threshold: float =
         return _single_anls(prediction, ground_truths[0], threshold)
 
     # Multiple answers (list items): model must output ALL items
-    # Split prediction into items by newline
-    pred_items = [line.strip() for line in prediction.split('\n') if line.strip()]
+    # Split prediction into items by newline, normalizing each line once
+    pred_items = [item for item in map(_normalize, prediction.split('\n')) if item]
 
     if not pred_items:
         return 0.0
 
     # For each ground truth item, find best matching prediction line
     total_anls = 0.0
-    for gt in ground_truths:
-        best = max(_single_anls(pred, gt, threshold) for pred in pred_items)
+    for gt in map(_normalize, ground_truths):
+        best = max(_normalized_anls(pred, gt, threshold) for pred in pred_items)
         total_anls += best
 
     # Average across all ground truth items
     return total_anls / len(ground_truths)
 
 
+def _normalize(text: str) -> str:
+    """Normalize answer text for comparison (case- and edge-whitespace-insensitive)."""
+    return text.lower().strip()
+
+
 def _single_anls(prediction: str, ground_truth: str, threshold: float = 0.5) -> float:
     """Calculate ANLS between a single prediction and single ground truth."""
-    pred_norm = prediction.lower().strip()
-    gt_norm = ground_truth.lower().strip()
+    return _normalized_anls(_normalize(prediction), _normalize(ground_truth), threshold)
+
 
+def _normalized_anls(pred_norm: str, gt_norm: str, threshold: float) -> float:
+    """Calculate ANLS between two already-normalized strings."""
     if not pred_norm and not gt_norm:
         return 1.0
     if not pred_norm or not gt_norm:
         return 0.0
 
-    lev_dist = _levenshtein(pred_norm, gt_norm)
+    # Exact match is the common case for correct model answers
+    if pred_norm == gt_norm:
+        return 1.0
+
     max_len = max(len(pred_norm), len(gt_norm))
+    # Largest distance that can still clear the threshold (+1 absorbs float
+    # rounding). Edit distance is at least the length difference, so longer
+    # gaps score 0 without running the DP at all.
+    max_dist = int((1.0 - threshold) * max_len) + 1
+    if abs(len(pred_norm) - len(gt_norm)) > max_dist:
+        return 0.0
+
+    # RapidFuzz's C++ kernel (bit-parallel Myers) replaces the pure-Python DP;
+    # score_cutoff lets it stop once the distance exceeds max_dist
+    lev_dist = Levenshtein.distance(pred_norm, gt_norm, score_cutoff=max_dist)
     anls = 1.0 - (lev_dist / max_len)
 
     return anls if anls >= threshold else 0.0
 
 
-def _levenshtein(s1: str, s2: str) -> int:
-    """Levenshtein distance via dynamic programming."""
-    if len(s1) < len(s2):
-        return _levenshtein(s2, s1)
-    if len(s2) == 0:
-        return len(s1)
-
-    prev_row = list(range(len(s2) + 1))
-    for i, c1 in enumerate(s1):
-        curr_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            curr_row.append(min(
-                prev_row[j + 1] + 1,
-                curr_row[j] + 1,
-                prev_row[j] + (c1 != c2),
-            ))
-        prev_row = curr_row
-    return prev_row[-1]
-
-
 def calculate_iou(pred_bbox: List[float], gt_bbox: List[float]) -> float:
     """
     Calculate IoU (Intersection over Union) for bounding boxes.
@@ -110,17 +112,17 @@ def calculate_iou(pred_bbox: List[float], gt_bbox: List[float]) -> float:
     if len(pred_bbox) != 4 or len(gt_bbox) != 4:
         return 0.0
 
-    x1 = max(pred_bbox[0], gt_bbox[0])
-    y1 = max(pred_bbox[1], gt_bbox[1])
-    x2 = min(pred_bbox[2], gt_bbox[2])
-    y2 = min(pred_bbox[3], gt_bbox[3])
-
-    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    px0, py0, px1, py1 = pred_bbox
+    gx0, gy0, gx1, gy1 = gt_bbox
 
-    pred_area = (pred_bbox[2] - pred_bbox[0]) * (pred_bbox[3] - pred_bbox[1])
-    gt_area = (gt_bbox[2] - gt_bbox[0]) * (gt_bbox[3] - gt_bbox[1])
+    # Intersection width/height; disjoint boxes return before any area math
+    iw = (px1 if px1 < gx1 else gx1) - (px0 if px0 > gx0 else gx0)
+    ih = (py1 if py1 < gy1 else gy1) - (py0 if py0 > gy0 else gy0)
+    if iw <= 0 or ih <= 0:
+        return 0.0
 
-    union = pred_area + gt_area - intersection
+    intersection = iw * ih
+    union = (px1 - px0) * (py1 - py0) + (gx1 - gx0) * (gy1 - gy0) - intersection
 
     if union <= 0:
         return 0.0
@@ -93,6 +93,7 @@ bbox는 정규화된 좌표(0-1 범위)로, 답변이 발견된 영역을 지정
 
 # Default prompt (English) for unknown languages
 DEFAULT_LANGUAGE = 'en'
+_DEFAULT_PROMPT = EVALUATION_PROMPTS[DEFAULT_LANGUAGE]
 
 
 def get_evaluation_prompt(question: str, language: str) -> str:
@@ -106,7 +107,7 @@ def get_evaluation_prompt(question: str, language: str) -> str:
     Returns:
         Formatted prompt string with the question embedded
     """
-    template = EVALUATION_PROMPTS.get(language, EVALUATION_PROMPTS[DEFAULT_LANGUAGE])
+    template = EVALUATION_PROMPTS.get(language, _DEFAULT_PROMPT)
     return template.format(question=question)
 
 
@@ -34,6 +34,13 @@ ANLS_CASES = [
     ("コーヒー", ["コーヒー"], 0.5),
     # Threshold boundary (at default τ=0.5, both implementations agree)
     ("abc", ["abd"], 0.5),              # ANLS=0.667, NLD=0.333 < 0.5 → kept
+    # Length gap vs. distance budget (early exit before the DP)
+    ("abcdef", ["abcd"], 0.5),          # gap 2 of 6 → ANLS=0.667, kept
+    ("abcdefg", ["abc"], 0.5),          # gap 4 of 7 → below threshold
+    ("hello world", ["hello"], 0.5),
+    # Long strings (> 64 chars exercise RapidFuzz's multi-word bit-parallel path)
+    ("東京都千代田区丸の内1-1-1 株式会社サンプル商事 " * 3, ["東京都千代田区丸の内1-1-2 株式会社サンプル商事 " * 3], 0.5),
+    ("item " * 40, ["item " * 38 + "items"], 0.5),
     # Edge cases
     ("", [""], 0.5),
     ("", ["hello"], 0.5),